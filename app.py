@@ -1,9 +1,20 @@
 import os
+import io
+import csv
+import gzip
+import hmac
+import json
+import math
+import time
+import zlib
 import sqlite3
+import threading
+import click
 import requests
-from flask import Flask, render_template, request, redirect, url_for, g, flash
+from flask import (Flask, render_template, request, redirect, url_for, g, flash,
+                   Response, stream_with_context, jsonify, abort)
 from contextlib import closing
-from datetime import datetime
+from datetime import date, datetime, timezone
 from functools import lru_cache
 
 app = Flask(__name__)
@@ -11,10 +22,83 @@ app.secret_key = os.getenv('SECRET_KEY', 'dev_secret_key')
 
 # Конфигурация
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE = os.path.join(BASE_DIR, 'travelai.db')
+DATABASE = os.getenv('DATABASE', os.path.join(BASE_DIR, 'travelai.db'))
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY', 'weather_api_personal_code')
 REST_COUNTRIES_URL = "https://restcountries.com/v3.1/all?fields=name,capital,flags,region,subregion,landlocked,languages,currencies,population,area"
 
+# Массовый импорт/экспорт: размер пачки при чтении курсора и при executemany
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '10000'))
+TRANSFER_FORMATS = ('jsonl', 'csv')
+TRANSFER_FORMAT_HELP = ("jsonl переносит данные без потерь; в csv NULL и пустая строка "
+                        "в текстовых полях неразличимы и при импорте читаются как ''")
+# Токен для HTTP-импорта/экспорта; без него маршруты отключены, остаются команды CLI
+DATA_TRANSFER_TOKEN = os.getenv('DATA_TRANSFER_TOKEN', '')
+# Поведение при конфликте ключей во время импорта
+IMPORT_CONFLICT_POLICIES = {
+    'abort': 'INSERT',
+    'ignore': 'INSERT OR IGNORE',
+    'replace': 'INSERT OR REPLACE',
+}
+
+# Хранение истории поиска: срок жизни, действие над устаревшими записями и архив
+SEARCH_RETENTION_DAYS = int(os.getenv('SEARCH_RETENTION_DAYS', '90'))
+SEARCH_RETENTION_ACTION = os.getenv('SEARCH_RETENTION_ACTION', 'archive')  # archive | rollup | delete
+SEARCH_ARCHIVE_FORMAT = os.getenv('SEARCH_ARCHIVE_FORMAT', 'jsonl')  # jsonl | sqlite
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+ARCHIVE_DATABASE = os.path.join(ARCHIVE_DIR, 'travelai_archive.db')
+MAINTENANCE_LOCK = DATABASE + '.maintenance-lock'
+RETENTION_ACTIONS = ('archive', 'rollup', 'delete')
+ARCHIVE_FORMATS = ('jsonl', 'sqlite')
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+# Интервал фонового обслуживания в секундах; по умолчанию 0 — очистка истории
+# включается явно, например RETENTION_INTERVAL=3600
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '0'))
+VACUUM_STEP_PAGES = int(os.getenv('VACUUM_STEP_PAGES', '100'))
+MAINTENANCE_PAUSE = float(os.getenv('MAINTENANCE_PAUSE', '0.2'))
+
+# Описание переносимых таблиц: (колонка, вид значения, обязательна, SQL-значение по умолчанию)
+TRANSFER_TABLES = {
+    'searches': (
+        ('id', 'id', False, None),
+        ('search_params', 'text', True, None),
+        ('budget', 'text', False, None),
+        ('timestamp', 'datetime', False, 'CURRENT_TIMESTAMP'),
+    ),
+    'favorites': (
+        ('id', 'id', False, None),
+        ('country_name', 'text', True, None),
+        ('capital', 'text', False, None),
+        ('flag_url', 'text', False, None),
+        ('weather_temp', 'int', False, None),
+        ('weather_desc', 'text', False, None),
+        ('search_id', 'int', False, None),
+        ('notes', 'text', False, None),
+        ('search_timestamp', 'datetime', False, None),
+    ),
+    'feedback': (
+        ('id', 'id', False, None),
+        ('country_name', 'text', True, None),
+        ('rating', 'rating', False, None),
+        ('comment', 'text', False, None),
+        ('timestamp', 'datetime', False, 'CURRENT_TIMESTAMP'),
+    ),
+    'travel_plans': (
+        ('id', 'id', False, None),
+        ('country_name', 'text', True, None),
+        ('start_date', 'date', False, None),
+        ('end_date', 'date', False, None),
+        ('budget', 'real', False, None),
+        ('activities', 'text', False, None),
+        ('status', 'text', False, "'planned'"),
+    ),
+}
+
+# Ссылки между таблицами, проверяемые при импорте: колонка -> таблица
+TRANSFER_REFERENCES = {
+    'favorites': {'search_id': 'searches'},
+}
+
 # Функции для работы с базой данных
 def get_db():
     """Устанавливает соединение с базой данных"""
@@ -23,12 +107,32 @@ def get_db():
         g.db.row_factory = sqlite3.Row
     return g.db
 
+def ensure_retention_schema(db):
+    """Создает агрегатную таблицу и индексы, нужные для очистки истории"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS search_daily_stats (
+            day DATE NOT NULL,
+            search_params TEXT NOT NULL,
+            searches_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, search_params)
+        )
+    """)
+    # Время поиска копируется в избранное перед удалением поиска из истории
+    favorite_columns = [row[1] for row in db.execute("PRAGMA table_info(favorites)")]
+    if 'search_timestamp' not in favorite_columns:
+        db.execute("ALTER TABLE favorites ADD COLUMN search_timestamp DATETIME")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_searches_timestamp ON searches (timestamp)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_favorites_search_id ON favorites (search_id)")
+
 def init_db():
     """Инициализирует базу данных"""
     with app.app_context():
         db = get_db()
         cursor = db.cursor()
         
+        # Для новой БД включаем постраничное освобождение места (действует до создания таблиц)
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS searches (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -48,6 +152,7 @@ def init_db():
                 weather_desc TEXT,
                 search_id INTEGER,
                 notes TEXT,
+                search_timestamp DATETIME,
                 FOREIGN KEY (search_id) REFERENCES searches (id)
             )
         """)
@@ -74,17 +179,28 @@ def init_db():
             )
         """)
         
+        ensure_retention_schema(db)
         db.commit()
 
 @app.teardown_appcontext
 def close_db(error):
     """Закрывает соединение с БД при завершении"""
-    if hasattr(g, 'db'):
-        g.db.close()
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+def migrate_db():
+    """Приводит схему существующей базы данных к текущей версии"""
+    with app.app_context():
+        db = get_db()
+        ensure_retention_schema(db)
+        db.commit()
 
 # Инициализация базы данных при старте
 if not os.path.exists(DATABASE):
     init_db()
+else:
+    migrate_db()
 
 # Функции работы с API
 @lru_cache(maxsize=100)
@@ -356,10 +472,11 @@ def get_favorites():
         cursor = db.cursor()
         cursor.execute("""
             SELECT f.id, f.country_name, f.capital, f.flag_url, f.weather_temp, 
-                   f.weather_desc, f.notes, s.search_params, s.timestamp
+                   f.weather_desc, f.notes, s.search_params,
+                   COALESCE(s.timestamp, f.search_timestamp) AS timestamp
             FROM favorites f
-            JOIN searches s ON f.search_id = s.id
-            ORDER BY s.timestamp DESC
+            LEFT JOIN searches s ON f.search_id = s.id
+            ORDER BY timestamp DESC, f.id DESC
         """)
         return cursor.fetchall()
     except sqlite3.Error as e:
@@ -398,6 +515,479 @@ def get_travel_plans():
         print(f"Ошибка при получении планов поездок: {e}")
         return []
 
+# Функции массового импорта/экспорта
+def get_transfer_columns(table):
+    """Список колонок переносимой таблицы"""
+    if table not in TRANSFER_TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    return [column for column, _, _, _ in TRANSFER_TABLES[table]]
+
+def iter_table_rows(db, table, batch_size=EXPORT_BATCH_SIZE):
+    """Построчное чтение таблицы страницами по ключу id"""
+    columns = get_transfer_columns(table)
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?"
+    last_id = 0
+    while True:
+        # Каждая страница — отдельный короткий запрос: блокировка чтения снимается
+        # до того, как клиент заберет данные, и не мешает записи в /recommend
+        rows = db.execute(sql, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            yield row
+        last_id = rows[-1][0]  # id всегда первая колонка
+
+def iter_export(db, table, fmt):
+    """Генератор строк экспорта в формате JSONL или CSV"""
+    columns = get_transfer_columns(table)
+    if fmt == 'jsonl':
+        for row in iter_table_rows(db, table):
+            yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+    elif fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in iter_table_rows(db, table):
+            writer.writerow(row)
+            # Отдаем накопленное и очищаем буфер, чтобы память не росла
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+def iter_import_records(stream, fmt):
+    """Построчное чтение записей импорта из текстового потока"""
+    if fmt == 'jsonl':
+        # Строки JSONL разбираются при проверке записи, чтобы битая строка
+        # считалась пропущенной, а не прерывала импорт
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+    elif fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+def parse_import_value(kind, value):
+    """Проверка и приведение одного значения импорта к виду колонки"""
+    if isinstance(value, (dict, list, bool)):
+        raise ValueError("ожидалось скалярное значение")
+    if kind == 'text':
+        return value if isinstance(value, str) else str(value)
+    if kind in ('int', 'id', 'rating'):
+        if isinstance(value, float):
+            if not value.is_integer():
+                raise ValueError("ожидалось целое число")
+            value = int(value)
+        elif isinstance(value, str):
+            value = int(value.strip())
+        # INTEGER в SQLite — 64-битное знаковое число
+        if not -2 ** 63 <= value < 2 ** 63:
+            raise ValueError("число вне диапазона INTEGER")
+        # Экспорт читает страницы начиная с id > 0
+        if kind == 'id' and value < 1:
+            raise ValueError("id должен быть положительным")
+        if kind == 'rating' and not 1 <= value <= 5:
+            raise ValueError("оценка должна быть от 1 до 5")
+        return value
+    if kind == 'real':
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError("ожидалось конечное число")
+        return value
+    if not isinstance(value, str):
+        raise ValueError("ожидалась строка с датой")
+    # Даты приводятся к виду, который понимают date() в SQLite и текстовое
+    # сравнение timestamp при очистке истории
+    if kind == 'date':
+        return date.fromisoformat(value).isoformat()
+    if kind == 'datetime':
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is not None:
+            # CURRENT_TIMESTAMP в SQLite хранится в UTC
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+def validate_record(table, record):
+    """Проверка и приведение типов записи импорта, возвращает кортеж значений"""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Некорректный JSON: {e}")
+    if not isinstance(record, dict):
+        raise ValueError("Запись должна быть объектом")
+    values = []
+    for column, kind, required, _ in TRANSFER_TABLES[table]:
+        value = record.get(column)
+        # Пустая ячейка CSV — отсутствие значения, кроме текстовых полей,
+        # где формы сохраняют пустую строку. Поэтому CSV не сохраняет NULL
+        # в текстовых полях, для точного переноса нужен JSONL
+        if value == '' and (required or kind != 'text'):
+            value = None
+        if value is None:
+            if required:
+                raise ValueError(f"Не заполнено обязательное поле {column}")
+            values.append(None)
+            continue
+        try:
+            values.append(parse_import_value(kind, value))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Некорректное значение поля {column}: {value!r} ({e})")
+    return tuple(values)
+
+def check_references(db, table, values):
+    """Проверка, что записи, на которые ссылается импортируемая строка, существуют"""
+    references = TRANSFER_REFERENCES.get(table)
+    if not references:
+        return
+    columns = get_transfer_columns(table)
+    for column, ref_table in references.items():
+        value = values[columns.index(column)]
+        if value is not None and not db.execute(
+                f"SELECT 1 FROM {ref_table} WHERE id = ?", (value,)).fetchone():
+            raise ValueError(f"Поле {column} ссылается на несуществующую запись {ref_table}: {value}")
+
+def new_import_stats():
+    """Счетчики импорта: вызывающий код видит их и при прерванном импорте"""
+    return {'imported': 0, 'skipped': 0, 'errors': []}
+
+def import_records(db, table, records, batch_size=IMPORT_BATCH_SIZE,
+                   on_conflict='abort', stats=None):
+    """Массовая вставка записей через executemany большими транзакциями"""
+    schema = TRANSFER_TABLES.get(table)
+    if schema is None:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    if on_conflict not in IMPORT_CONFLICT_POLICIES:
+        raise ValueError(f"Неизвестная политика конфликтов: {on_conflict}")
+    columns = ', '.join(column for column, _, _, _ in schema)
+    placeholders = ', '.join(
+        f"COALESCE(?, {default})" if default else "?"
+        for _, _, _, default in schema
+    )
+    sql = f"{IMPORT_CONFLICT_POLICIES[on_conflict]} INTO {table} ({columns}) VALUES ({placeholders})"
+
+    if stats is None:
+        stats = new_import_stats()
+    batch = []
+
+    def flush():
+        try:
+            inserted = db.executemany(sql, batch).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        stats['imported'] += inserted
+        # При on_conflict='ignore' часть строк не вставляется
+        stats['skipped'] += len(batch) - inserted
+        batch.clear()
+
+    for line_no, record in enumerate(records, start=1):
+        try:
+            values = validate_record(table, record)
+            check_references(db, table, values)
+            batch.append(values)
+        except ValueError as e:
+            stats['skipped'] += 1
+            if len(stats['errors']) < 100:
+                stats['errors'].append(f"Запись {line_no}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+# Функции хранения и архивации истории поиска
+def get_maintenance_db():
+    """Отдельное соединение для фонового обслуживания БД вне контекста запроса"""
+    db = sqlite3.connect(DATABASE, timeout=30)
+    db.row_factory = sqlite3.Row
+    return db
+
+def select_expired_searches(db, cutoff, after_id, max_id, limit):
+    """Поиски старше заданной даты в диапазоне id (after_id, max_id]"""
+    cursor = db.execute("""
+        SELECT s.id, s.search_params, s.budget, s.timestamp
+        FROM searches s
+        WHERE s.id > ? AND s.id <= ?
+          AND s.timestamp < ?
+        ORDER BY s.id
+        LIMIT ?
+    """, (after_id, max_id, cutoff, limit))
+    return cursor.fetchall()
+
+def rollup_searches(db, ids):
+    """Перенос количества поисков в дневную агрегатную таблицу"""
+    placeholders = ', '.join('?' * len(ids))
+    db.execute(f"""
+        INSERT INTO search_daily_stats (day, search_params, searches_count)
+        SELECT date(timestamp), search_params, COUNT(*)
+        FROM searches
+        WHERE id IN ({placeholders})
+        GROUP BY date(timestamp), search_params
+        ON CONFLICT (day, search_params)
+        DO UPDATE SET searches_count = searches_count + excluded.searches_count
+    """, ids)
+
+def detach_favorites(db, ids):
+    """Отвязка избранного от удаляемых поисков с сохранением времени поиска"""
+    placeholders = ', '.join('?' * len(ids))
+    db.execute(f"""
+        UPDATE favorites
+        SET search_timestamp = (SELECT timestamp FROM searches WHERE id = favorites.search_id),
+            search_id = NULL
+        WHERE search_id IN ({placeholders})
+    """, ids)
+
+def archive_searches_jsonl(rows, path):
+    """Дописывание пачки в сжатый JSONL-файл отдельным членом gzip"""
+    columns = get_transfer_columns('searches')
+    with gzip.open(path, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+
+def iter_pending_archive(path):
+    """Чтение записей незавершенного архива до первого оборванного места"""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as pending:
+            for line in pending:
+                # Оборванная строка — след сбоя во время записи, дальше читать нечего
+                if not line.endswith("\n"):
+                    return
+                yield json.loads(line)
+    except (EOFError, OSError, zlib.error):
+        return
+
+def promote_archive(db, pending_path):
+    """Перенос из незавершенного архива в итоговый записей, удаление которых зафиксировано"""
+    archive_path = pending_path[:-len('.pending')]
+    # Итоговый файл появляется атомарно: если он есть, перенос уже выполнен
+    if not os.path.exists(archive_path):
+        temp_path = archive_path + '.tmp'
+        kept = 0
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as archive:
+            for record in iter_pending_archive(pending_path):
+                # Запись еще в таблице — ее пачка откатилась и в архив не идет
+                if db.execute("SELECT 1 FROM searches WHERE id = ?",
+                              (record['id'],)).fetchone():
+                    continue
+                archive.write(json.dumps(record, ensure_ascii=False) + "\n")
+                kept += 1
+        if kept:
+            os.replace(temp_path, archive_path)
+        else:
+            os.remove(temp_path)
+    os.remove(pending_path)
+
+def new_archive_path():
+    """Имя архива для прохода очистки, не совпадающее с уже существующими"""
+    stamp = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+    archive_path = os.path.join(ARCHIVE_DIR, f"searches-{stamp}.jsonl.gz")
+    suffix = 0
+    # Существующий итоговый файл означает завершенный перенос, поэтому имя не должно повторяться
+    while os.path.exists(archive_path) or os.path.exists(archive_path + '.pending'):
+        suffix += 1
+        archive_path = os.path.join(ARCHIVE_DIR, f"searches-{stamp}-{suffix}.jsonl.gz")
+    return archive_path
+
+def recover_pending_archives(db):
+    """Завершение архивов, оставшихся от прервавшихся проходов очистки"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+    for name in os.listdir(ARCHIVE_DIR):
+        if name.endswith('.jsonl.gz.pending'):
+            promote_archive(db, os.path.join(ARCHIVE_DIR, name))
+
+def attach_archive_db(db):
+    """Подключение отдельного файла SQLite для холодных записей"""
+    db.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE,))
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS archive.searches (
+            id INTEGER PRIMARY KEY,
+            search_params TEXT NOT NULL,
+            budget TEXT,
+            timestamp DATETIME
+        )
+    """)
+    db.commit()
+
+def archive_searches_sqlite(db, ids):
+    """Копирование записей в подключенную архивную БД"""
+    placeholders = ', '.join('?' * len(ids))
+    db.execute(f"""
+        INSERT OR IGNORE INTO archive.searches (id, search_params, budget, timestamp)
+        SELECT id, search_params, budget, timestamp
+        FROM main.searches
+        WHERE id IN ({placeholders})
+    """, ids)
+
+def acquire_maintenance_lock():
+    """Межпроцессная блокировка прохода очистки; None, если проход уже идет"""
+    lock = sqlite3.connect(MAINTENANCE_LOCK, timeout=0, isolation_level=None)
+    try:
+        # Блокировку файла снимает ОС и при аварийном завершении процесса
+        lock.execute("BEGIN EXCLUSIVE")
+    except sqlite3.OperationalError:
+        lock.close()
+        return None
+    return lock
+
+def apply_search_retention(db, days=SEARCH_RETENTION_DAYS, action=SEARCH_RETENTION_ACTION,
+                           archive_format=SEARCH_ARCHIVE_FORMAT,
+                           batch_size=RETENTION_BATCH_SIZE, pause=0):
+    """Очистка устаревшей истории поиска короткими транзакциями"""
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f"Неизвестное действие: {action}")
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"Неизвестный формат архива: {archive_format}")
+
+    # Одновременно идет только один проход: иначе параллельные воркеры
+    # разбирали бы чужие незавершенные пачки архива
+    lock = acquire_maintenance_lock()
+    if lock is None:
+        return {'removed': 0, 'archived': 0, 'busy': True}
+    with closing(lock):
+        return run_search_retention(db, days, action, archive_format, batch_size, pause)
+
+def run_search_retention(db, days, action, archive_format, batch_size, pause):
+    """Проход очистки истории; вызывается под блокировкой обслуживания"""
+    ensure_retention_schema(db)
+    db.commit()
+    cutoff = db.execute("SELECT datetime('now', ?)", (f"-{int(days)} days",)).fetchone()[0]
+
+    archive_path = pending_path = None
+    if action == 'archive':
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        if archive_format == 'sqlite':
+            attach_archive_db(db)
+        else:
+            recover_pending_archives(db)
+            archive_path = new_archive_path()
+            pending_path = archive_path + '.pending'
+
+    # Верхняя граница по индексу timestamp: сканирование не заходит в свежие записи
+    max_id = db.execute(
+        "SELECT MAX(id) FROM searches WHERE timestamp < ?", (cutoff,)).fetchone()[0] or 0
+
+    stats = {'removed': 0, 'archived': 0}
+    last_id = 0
+    try:
+        while True:
+            # Пачка читается уже внутри транзакции записи: в архив попадают
+            # ровно те строки, которые удалит этот же DELETE
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = select_expired_searches(db, cutoff, last_id, max_id, batch_size)
+                if not rows:
+                    db.rollback()
+                    break
+                ids = [row['id'] for row in rows]
+                last_id = ids[-1]
+                if action != 'delete':
+                    rollup_searches(db, ids)
+                if action == 'archive':
+                    # Пачки JSONL копятся в незавершенном файле и попадают в итоговый
+                    # архив только после commit, чтобы не терять и не дублировать записи
+                    if archive_format == 'sqlite':
+                        archive_searches_sqlite(db, ids)
+                    else:
+                        archive_searches_jsonl(rows, pending_path)
+                detach_favorites(db, ids)
+                removed = db.execute(
+                    f"DELETE FROM searches WHERE id IN ({', '.join('?' * len(ids))})",
+                    ids).rowcount
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            if action == 'archive':
+                stats['archived'] += removed
+            stats['removed'] += removed
+            # Пауза между пачками дает место запросам пользователей
+            if pause:
+                time.sleep(pause)
+    finally:
+        if action == 'archive' and archive_format == 'sqlite':
+            db.execute("DETACH DATABASE archive")
+        if pending_path and os.path.exists(pending_path):
+            promote_archive(db, pending_path)
+    return stats
+
+def incremental_vacuum_step(db, pages=VACUUM_STEP_PAGES):
+    """Освобождение небольшого числа свободных страниц файла БД"""
+    # 2 — режим INCREMENTAL, в остальных режимах PRAGMA incremental_vacuum ничего не делает
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    free_pages = db.execute("PRAGMA freelist_count").fetchone()[0]
+    if not free_pages:
+        return 0
+    db.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return free_pages - db.execute("PRAGMA freelist_count").fetchone()[0]
+
+def compact_database(db, pages=VACUUM_STEP_PAGES, pause=0):
+    """Постепенное сжатие БД небольшими шагами"""
+    total = 0
+    while True:
+        freed = incremental_vacuum_step(db, pages)
+        if not freed:
+            break
+        total += freed
+        if pause:
+            time.sleep(pause)
+    return total
+
+def enable_incremental_vacuum(db):
+    """Перевод существующей БД в режим INCREMENTAL (однократный полный VACUUM)"""
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    db.execute("VACUUM")
+
+def run_maintenance(pause=MAINTENANCE_PAUSE):
+    """Один проход обслуживания: очистка истории и сжатие БД"""
+    with closing(get_maintenance_db()) as db:
+        stats = apply_search_retention(db, pause=pause)
+        stats['freed_pages'] = compact_database(db, pause=pause)
+    return stats
+
+def maintenance_worker(interval=RETENTION_INTERVAL):
+    """Фоновый цикл обслуживания БД"""
+    while True:
+        try:
+            stats = run_maintenance()
+            if stats['removed'] or stats['freed_pages']:
+                print(f"Обслуживание БД: {stats}")
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Ошибка при обслуживании БД: {e}")
+        time.sleep(interval)
+
+def start_maintenance_worker():
+    """Запуск фонового обслуживания БД в отдельном потоке"""
+    if RETENTION_INTERVAL <= 0:
+        return None
+    worker = threading.Thread(target=maintenance_worker, name="db-maintenance", daemon=True)
+    worker.start()
+    return worker
+
+maintenance_lock = threading.Lock()
+maintenance_started = False
+
+@app.before_request
+def ensure_maintenance_worker():
+    """Однократный запуск фонового обслуживания при первом запросе к процессу"""
+    global maintenance_started
+    if maintenance_started:
+        return
+    with maintenance_lock:
+        if not maintenance_started:
+            start_maintenance_worker()
+            maintenance_started = True
+
 # Маршруты Flask
 @app.route("/")
 def home():
@@ -673,6 +1263,127 @@ def country_detail(country_name):
     
     return render_template("country.html", country=country_data, reviews=reviews)
 
+def check_transfer_access():
+    """Доступ к HTTP-импорту/экспорту только при заданном токене"""
+    if not DATA_TRANSFER_TOKEN:
+        abort(404)
+    token = request.headers.get("X-Transfer-Token", "")
+    if not hmac.compare_digest(token.encode(), DATA_TRANSFER_TOKEN.encode()):
+        abort(403)
+
+@app.route("/export/<table>.<fmt>")
+def export_table(table, fmt):
+    """Потоковая выгрузка таблицы в JSONL или CSV (CSV не отличает NULL от пустой строки)"""
+    check_transfer_access()
+    if table not in TRANSFER_TABLES or fmt not in TRANSFER_FORMATS:
+        abort(404)
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+
+    def generate():
+        # Соединение открывается уже в контексте потоковой отдачи
+        yield from iter_export(get_db(), table, fmt)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=f"{mimetype}; charset=utf-8",
+        headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'}
+    )
+
+@app.route("/import/<table>", methods=["POST"])
+def import_table(table):
+    """Массовая загрузка записей из файла JSONL или CSV"""
+    check_transfer_access()
+    if table not in TRANSFER_TABLES:
+        abort(404)
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({'error': 'Файл не передан'}), 400
+
+    fmt = request.form.get("format") or os.path.splitext(upload.filename or '')[1].lstrip('.')
+    if fmt not in TRANSFER_FORMATS:
+        return jsonify({'error': f'Неподдерживаемый формат: {fmt}'}), 400
+
+    on_conflict = request.form.get("on_conflict", "abort")
+    if on_conflict not in IMPORT_CONFLICT_POLICIES:
+        return jsonify({'error': f'Неизвестная политика конфликтов: {on_conflict}'}), 400
+
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    stats = new_import_stats()
+    try:
+        import_records(get_db(), table, iter_import_records(stream, fmt),
+                       on_conflict=on_conflict, stats=stats)
+    except (ValueError, csv.Error) as e:
+        return jsonify({**stats, 'error': f'Ошибка разбора файла: {e}'}), 400
+    except sqlite3.Error as e:
+        print(f"Ошибка при импорте в {table}: {e}")
+        return jsonify({**stats, 'error': f'Ошибка базы данных при импорте: {e}'}), 500
+    return jsonify(stats)
+
+# Команды CLI
+@app.cli.command("export-data")
+@click.argument("table", type=click.Choice(list(TRANSFER_TABLES)))
+@click.option("--format", "fmt", type=click.Choice(TRANSFER_FORMATS), default="jsonl",
+              help=TRANSFER_FORMAT_HELP)
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-")
+def export_data_command(table, fmt, output):
+    """Выгрузка таблицы в JSONL или CSV"""
+    for chunk in iter_export(get_db(), table, fmt):
+        output.write(chunk)
+
+@app.cli.command("import-data")
+@click.argument("table", type=click.Choice(list(TRANSFER_TABLES)))
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(TRANSFER_FORMATS), default=None,
+              help=TRANSFER_FORMAT_HELP)
+@click.option("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+@click.option("--on-conflict", type=click.Choice(list(IMPORT_CONFLICT_POLICIES)), default="abort")
+def import_data_command(table, source, fmt, batch_size, on_conflict):
+    """Загрузка записей в таблицу из JSONL или CSV"""
+    if fmt is None:
+        fmt = os.path.splitext(source.name)[1].lstrip('.')
+        if fmt not in TRANSFER_FORMATS:
+            raise click.UsageError("Не удалось определить формат, укажите --format")
+    stats = new_import_stats()
+    try:
+        import_records(get_db(), table, iter_import_records(source, fmt), batch_size,
+                       on_conflict, stats)
+        failure = None
+    except (ValueError, csv.Error) as e:
+        failure = f"Ошибка разбора файла: {e}"
+    except sqlite3.Error as e:
+        failure = f"Ошибка базы данных при импорте: {e}"
+    for error in stats['errors']:
+        click.echo(error, err=True)
+    click.echo(f"Импортировано: {stats['imported']}, пропущено: {stats['skipped']}")
+    if failure:
+        raise click.ClickException(failure)
+
+@app.cli.command("apply-retention")
+@click.option("--days", type=int, default=SEARCH_RETENTION_DAYS)
+@click.option("--action", type=click.Choice(RETENTION_ACTIONS), default=SEARCH_RETENTION_ACTION)
+@click.option("--archive-format", type=click.Choice(ARCHIVE_FORMATS), default=SEARCH_ARCHIVE_FORMAT)
+@click.option("--compact/--no-compact", default=True)
+def apply_retention_command(days, action, archive_format, compact):
+    """Очистка устаревшей истории поиска и сжатие БД"""
+    with closing(get_maintenance_db()) as db:
+        try:
+            stats = apply_search_retention(db, days, action, archive_format,
+                                           pause=MAINTENANCE_PAUSE)
+            freed = compact_database(db, pause=MAINTENANCE_PAUSE) if compact else 0
+        except sqlite3.Error as e:
+            raise click.ClickException(f"Ошибка базы данных при очистке: {e}")
+    if stats.get('busy'):
+        click.echo("Очистка истории уже выполняется другим процессом")
+    click.echo(f"Удалено: {stats['removed']}, в архиве: {stats['archived']}, "
+               f"освобождено страниц: {freed}")
+
+@app.cli.command("enable-incremental-vacuum")
+def enable_incremental_vacuum_command():
+    """Однократный перевод существующей БД в режим incremental_vacuum"""
+    with closing(get_maintenance_db()) as db:
+        enable_incremental_vacuum(db)
+    click.echo("Режим auto_vacuum = INCREMENTAL включен")
+
 if __name__ == "__main__":
     if not os.path.exists(DATABASE):
         init_db()
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# База при импорте app создается во временном каталоге, а не рядом с кодом
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'travelai.db'))
+os.environ.setdefault('RETENTION_INTERVAL', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as travel_app  # noqa: E402
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """Модуль приложения с отдельными базой и архивом для каждого теста"""
+    database = str(tmp_path / 'travelai.db')
+    monkeypatch.setattr(travel_app, 'DATABASE', database)
+    monkeypatch.setattr(travel_app, 'MAINTENANCE_LOCK', database + '.maintenance-lock')
+    monkeypatch.setattr(travel_app, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setattr(travel_app, 'ARCHIVE_DATABASE', str(tmp_path / 'archive' / 'archive.db'))
+    travel_app.init_db()
+    return travel_app
+
+
+@pytest.fixture
+def db(app_module):
+    """Соединение с тестовой базой вне контекста запроса"""
+    connection = app_module.get_maintenance_db()
+    yield connection
+    connection.close()
@@ -0,0 +1,119 @@
+import io
+import json
+
+import pytest
+
+
+def import_lines(app_module, db, table, lines, fmt='jsonl', **kwargs):
+    stream = io.StringIO(''.join(lines))
+    return app_module.import_records(db, table, app_module.iter_import_records(stream, fmt),
+                                     **kwargs)
+
+
+@pytest.mark.parametrize('record, message', [
+    ({'country_name': 'France', 'rating': 4.9}, 'целое'),
+    ({'country_name': {'a': 1}}, 'скалярное'),
+    ({'country_name': 'France', 'rating': 7}, 'от 1 до 5'),
+    ({'country_name': 'France', 'timestamp': '2020-13-01'}, 'timestamp'),
+    ({'id': -5, 'country_name': 'France'}, 'положительным'),
+    ({'id': 10 ** 20, 'country_name': 'France'}, 'диапазона'),
+    ({'rating': 5}, 'обязательное'),
+])
+def test_validate_record_rejects_invalid_values(app_module, record, message):
+    with pytest.raises(ValueError, match=message):
+        app_module.validate_record('feedback', record)
+
+
+def test_validate_record_normalizes_dates(app_module):
+    values = app_module.validate_record('feedback', {
+        'country_name': 'France', 'rating': '5', 'timestamp': '2020-01-01T10:00:00+03:00',
+    })
+    assert values == (None, 'France', 5, None, '2020-01-01 07:00:00')
+
+    plan = app_module.validate_record('travel_plans', {
+        'country_name': 'Italy', 'start_date': '20200101', 'end_date': '',
+    })
+    assert plan[2:4] == ('2020-01-01', None)
+
+
+def test_import_skips_bad_lines_and_keeps_going(app_module, db):
+    stats = import_lines(app_module, db, 'feedback', [
+        '{"country_name": "France", "rating": 5}\n',
+        '{bad json\n',
+        '{"rating": 3}\n',
+        '{"country_name": "Italy", "rating": 4}\n',
+    ])
+    assert stats['imported'] == 2
+    assert stats['skipped'] == 2
+    assert len(stats['errors']) == 2
+    assert db.execute("SELECT COUNT(*) FROM feedback").fetchone()[0] == 2
+
+
+def test_import_reports_committed_rows_on_conflict(app_module, db):
+    stats = app_module.new_import_stats()
+    with pytest.raises(app_module.sqlite3.IntegrityError):
+        import_lines(app_module, db, 'feedback', [
+            '{"id": 1, "country_name": "France"}\n',
+            '{"id": 2, "country_name": "Italy"}\n',
+            '{"id": 1, "country_name": "Spain"}\n',
+        ], batch_size=1, stats=stats)
+    assert stats['imported'] == 2
+    assert db.execute("SELECT COUNT(*) FROM feedback").fetchone()[0] == 2
+
+
+def test_import_ignore_policy_counts_duplicates_as_skipped(app_module, db):
+    lines = ['{"id": 1, "country_name": "France"}\n', '{"id": 2, "country_name": "Italy"}\n']
+    import_lines(app_module, db, 'feedback', lines)
+    stats = import_lines(app_module, db, 'feedback', lines, on_conflict='ignore')
+    assert stats == {'imported': 0, 'skipped': 2, 'errors': []}
+
+
+def test_import_checks_favorite_search_reference(app_module, db):
+    db.execute("INSERT INTO searches (id, search_params) VALUES (1, 'пляж')")
+    db.commit()
+    stats = import_lines(app_module, db, 'favorites', [
+        '{"country_name": "France", "search_id": 1}\n',
+        '{"country_name": "Italy", "search_id": 99}\n',
+    ])
+    assert stats['imported'] == 1
+    assert 'search_id' in stats['errors'][0]
+
+
+def test_export_pages_through_all_rows(app_module, db):
+    db.executemany("INSERT INTO feedback (country_name, rating) VALUES (?, ?)",
+                   [(f"Country {i}", i % 5 + 1) for i in range(25)])
+    db.commit()
+    rows = list(app_module.iter_table_rows(db, 'feedback', batch_size=10))
+    assert [row[0] for row in rows] == list(range(1, 26))
+
+
+def test_csv_round_trip_keeps_empty_text(app_module, db):
+    db.execute("INSERT INTO travel_plans (country_name, activities) VALUES ('Italy', '')")
+    db.commit()
+    exported = ''.join(app_module.iter_export(db, 'travel_plans', 'csv'))
+    db.execute("DELETE FROM travel_plans")
+    db.commit()
+
+    stats = import_lines(app_module, db, 'travel_plans', [exported], fmt='csv')
+    assert stats['imported'] == 1
+    row = db.execute("SELECT budget, activities, status FROM travel_plans").fetchone()
+    assert tuple(row) == (None, '', 'planned')
+
+
+def test_http_transfer_requires_token(app_module, monkeypatch):
+    client = app_module.app.test_client()
+    assert client.get('/export/feedback.jsonl').status_code == 404
+
+    monkeypatch.setattr(app_module, 'DATA_TRANSFER_TOKEN', 'secret')
+    assert client.get('/export/feedback.jsonl').status_code == 403
+
+    headers = {'X-Transfer-Token': 'secret'}
+    response = client.post('/import/feedback', headers=headers, data={
+        'file': (io.BytesIO(b'{"country_name": "France", "rating": 5}\n'), 'feedback.jsonl'),
+    })
+    assert response.status_code == 200
+    assert response.json['imported'] == 1
+
+    response = client.get('/export/feedback.jsonl', headers=headers)
+    assert response.status_code == 200
+    assert json.loads(response.data)['country_name'] == 'France'
@@ -0,0 +1,164 @@
+import gzip
+import json
+import os
+import sqlite3
+
+import pytest
+
+
+def add_searches(db, count, timestamp='2020-01-01 10:00:00', params='пляж|1000'):
+    db.executemany("INSERT INTO searches (search_params, budget, timestamp) VALUES (?, '1000', ?)",
+                   [(params, timestamp)] * count)
+    db.commit()
+
+
+def read_archives(app_module):
+    """Записи всех итоговых JSONL-архивов"""
+    records = []
+    for name in sorted(os.listdir(app_module.ARCHIVE_DIR)):
+        if name.endswith('.jsonl.gz'):
+            with gzip.open(os.path.join(app_module.ARCHIVE_DIR, name), 'rt',
+                           encoding='utf-8') as archive:
+                records.extend(archive)
+    return records
+
+
+def test_retention_rolls_up_and_archives_in_batches(app_module, db):
+    add_searches(db, 7, params='пляж|1000')
+    add_searches(db, 3, params='горы|500')
+    db.execute("INSERT INTO searches (search_params) VALUES ('свежий')")
+    db.commit()
+
+    stats = app_module.apply_search_retention(db, days=90, batch_size=4)
+
+    assert stats == {'removed': 10, 'archived': 10}
+    assert [row[0] for row in db.execute("SELECT search_params FROM searches")] == ['свежий']
+    rollup = dict(db.execute("SELECT search_params, searches_count FROM search_daily_stats"))
+    assert rollup == {'пляж|1000': 7, 'горы|500': 3}
+    assert len(read_archives(app_module)) == 10
+    assert not [name for name in os.listdir(app_module.ARCHIVE_DIR) if name.endswith('.pending')]
+
+
+def test_retention_to_attached_sqlite_archive(app_module, db):
+    add_searches(db, 5)
+    stats = app_module.apply_search_retention(db, days=90, archive_format='sqlite', batch_size=2)
+    assert stats['archived'] == 5
+    with sqlite3.connect(app_module.ARCHIVE_DATABASE) as archive:
+        assert archive.execute("SELECT COUNT(*) FROM searches").fetchone()[0] == 5
+
+
+def test_retention_detaches_favorites(app_module, db):
+    add_searches(db, 1)
+    db.execute("INSERT INTO favorites (country_name, search_id) VALUES ('France', 1)")
+    db.commit()
+
+    app_module.apply_search_retention(db, days=90)
+
+    favorite = db.execute("SELECT search_id, search_timestamp FROM favorites").fetchone()
+    assert tuple(favorite) == (None, '2020-01-01 10:00:00')
+    with app_module.app.app_context():
+        favorites = app_module.get_favorites()
+    assert [(row['country_name'], row['timestamp']) for row in favorites] == [
+        ('France', '2020-01-01 10:00:00')]
+
+
+def test_retention_skips_run_while_another_holds_lock(app_module, db):
+    add_searches(db, 3)
+    lock = app_module.acquire_maintenance_lock()
+    try:
+        assert app_module.apply_search_retention(db, days=90)['busy'] is True
+        assert db.execute("SELECT COUNT(*) FROM searches").fetchone()[0] == 3
+    finally:
+        lock.close()
+    assert app_module.apply_search_retention(db, days=90)['removed'] == 3
+
+
+def test_overlapping_runs_archive_each_row_once(app_module, db, monkeypatch):
+    add_searches(db, 10)
+    write_batch = app_module.archive_searches_jsonl
+    overlapping = []
+
+    def write_and_start_second_run(rows, path):
+        write_batch(rows, path)
+        if not overlapping:
+            with app_module.closing(app_module.get_maintenance_db()) as other:
+                overlapping.append(app_module.apply_search_retention(other, days=90))
+
+    monkeypatch.setattr(app_module, 'archive_searches_jsonl', write_and_start_second_run)
+    stats = app_module.apply_search_retention(db, days=90, batch_size=4)
+
+    assert overlapping[0]['busy'] is True
+    assert stats['archived'] == 10
+    assert len(read_archives(app_module)) == 10
+
+
+def test_rolled_back_batch_is_not_archived(app_module, db):
+    add_searches(db, 8)
+    db.execute("""
+        CREATE TRIGGER keep_searches BEFORE DELETE ON searches WHEN old.id > 4
+        BEGIN SELECT RAISE(ABORT, 'keep'); END
+    """)
+    db.commit()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        app_module.apply_search_retention(db, days=90, batch_size=4)
+    assert len(read_archives(app_module)) == 4
+
+    db.execute("DROP TRIGGER keep_searches")
+    db.commit()
+    assert app_module.apply_search_retention(db, days=90, batch_size=4)['archived'] == 4
+    archived_ids = sorted(json.loads(line)['id'] for line in read_archives(app_module))
+    assert archived_ids == list(range(1, 9))
+
+
+def test_recovery_does_not_duplicate_promoted_archive(app_module, db):
+    os.makedirs(app_module.ARCHIVE_DIR)
+    pending = os.path.join(app_module.ARCHIVE_DIR, 'searches-crash.jsonl.gz.pending')
+    app_module.archive_searches_jsonl([(100, 'пляж', None, '2020-01-01 10:00:00')], pending)
+    # Сбой после os.replace, но до удаления незавершенного файла
+    with open(pending, 'rb') as source, \
+            open(pending[:-len('.pending')], 'wb') as target:
+        target.write(source.read())
+
+    app_module.recover_pending_archives(db)
+
+    assert not os.path.exists(pending)
+    assert len(read_archives(app_module)) == 1
+
+
+def test_recovery_reads_truncated_pending_archive(app_module, db):
+    os.makedirs(app_module.ARCHIVE_DIR)
+    pending = os.path.join(app_module.ARCHIVE_DIR, 'searches-crash.jsonl.gz.pending')
+    app_module.archive_searches_jsonl([(100, 'пляж', None, '2020-01-01 10:00:00')], pending)
+    with open(pending, 'ab') as archive:
+        archive.write(gzip.compress(b'{"id": 101, "search_par')[:-5])
+
+    app_module.recover_pending_archives(db)
+
+    records = read_archives(app_module)
+    assert len(records) == 1 and '"id": 100' in records[0]
+
+
+def test_compaction_releases_free_pages(app_module, db):
+    add_searches(db, 3000, params='x' * 200)
+    app_module.apply_search_retention(db, days=90, action='delete', batch_size=1000)
+    assert db.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+    freed = app_module.compact_database(db, pages=10)
+
+    assert freed > 0
+    assert db.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_maintenance_worker_starts_once_when_enabled(app_module, monkeypatch):
+    started = []
+    monkeypatch.setattr(app_module, 'maintenance_started', False)
+    monkeypatch.setattr(app_module, 'start_maintenance_worker', lambda: started.append(1))
+    for _ in range(3):
+        app_module.ensure_maintenance_worker()
+    assert started == [1]
+
+
+def test_maintenance_worker_not_started_without_interval(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'RETENTION_INTERVAL', 0)
+    assert app_module.start_maintenance_worker() is None